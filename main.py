@@ -6,15 +6,33 @@ r.hachana@innopolis.university
 """
 
 from datetime import datetime
+import os
 import random
 
+# Append-only log file shared by all the games of the current session
+_LOG_FILE_NAME = None
+_LOG_FD = None
+
+
+# Number of days in each month of a non-leap year (indexed from 1)
+DAY_COUNT_FOR_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
 
 def is_valid_date(year, month, day):
     """Returns True if the given day, month, and year form a valid date"""
-    day_count_for_month = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-    if year%4==0 and (year%100 != 0 or year%400==0):
-        day_count_for_month[2] = 29
-    return (1 <= month <= 12 and 1 <= day <= day_count_for_month[month] and year>1850)
+    if not (1 <= month <= 12 and year>1850):
+        return False
+    day_count = DAY_COUNT_FOR_MONTH[month]
+    if month == 2 and year%4==0 and (year%100 != 0 or year%400==0):
+        day_count = 29
+    return 1 <= day <= day_count
+
+def session_log_fd():
+    """Opens the session log file on first use and returns its file descriptor"""
+    global _LOG_FILE_NAME, _LOG_FD
+    if _LOG_FD is None:
+        _LOG_FILE_NAME = datetime.now().strftime("%d_%H_%M_%S.txt")
+        _LOG_FD = os.open(_LOG_FILE_NAME, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    return _LOG_FD
 
 def print_separator():
     """Prints a separator to the terminal for better output clarity"""
@@ -34,20 +52,21 @@ class GameInitialization:
         """
         Reads the date of birth input, checks its validity and returns the result
         """
-        try:
-            line = input("Enter your date of birth in the format DD-MM-YYYY:  ")
-            day, month, year = map(int, line.split('-'))
-            assert is_valid_date(year, month, day)
-
-            cls.birth_day = day
-            cls.birth_month = month
-            cls.birth_year = year
-            return day, month, year
-        except KeyboardInterrupt:
-            raise
-        except:
-            print("\nInvalid date input.\n")
-            return cls.read_date_of_birth()
+        while True:
+            try:
+                line = input("Enter your date of birth in the format DD-MM-YYYY:  ")
+                day, month, year = map(int, line.split('-'))
+                if not is_valid_date(year, month, day):
+                    raise ValueError("Invalid date")
+
+                cls.birth_day = day
+                cls.birth_month = month
+                cls.birth_year = year
+                return day, month, year
+            except (KeyboardInterrupt, EOFError):
+                raise
+            except Exception:
+                print("\nInvalid date input.\n")
 
 
     @classmethod
@@ -55,16 +74,17 @@ class GameInitialization:
         """
         Reads the initial position and checks its validity
         """
-        try:
-            result = int(input(f"Enter the initial position (should be in the interval [1 .. {cls.birth_day + cls.birth_month + cls.birth_year}]): "))
-            # TODO: Should we include the final position here?
-            assert result >= 1 and result <= cls.birth_day + cls.birth_month + cls.birth_year
-            return result
-        except KeyboardInterrupt:
-            raise
-        except:
-            print("\nInvalid input\n")
-            return cls.read_initial_position()
+        while True:
+            try:
+                result = int(input(f"Enter the initial position (should be in the interval [1 .. {cls.birth_day + cls.birth_month + cls.birth_year}]): "))
+                # TODO: Should we include the final position here?
+                if not 1 <= result <= cls.birth_day + cls.birth_month + cls.birth_year:
+                    raise ValueError("Initial position out of range")
+                return result
+            except (KeyboardInterrupt, EOFError):
+                raise
+            except Exception:
+                print("\nInvalid input\n")
 
     @classmethod
     def random_initial_position(cls):
@@ -76,45 +96,48 @@ class GameInitialization:
     @classmethod
     def define_intial_position(cls):
         """Prompts the user to choose either a random or user initial position, then returns either a read from the stdin or a random initial position"""
-        try:
-            result = input("Do you want to specify the intial position (otherwise it will be randomly initialized)? Enter either y or n:  ")
-            assert result in ['y', 'n']
-            if result == 'y':
-                return cls.read_initial_position()
-            return cls.random_initial_position()
-        except KeyboardInterrupt:
-            raise
-        except:
-            print("\nInvalid input.\n")
-            return cls.define_intial_position()
+        while True:
+            try:
+                result = input("Do you want to specify the intial position (otherwise it will be randomly initialized)? Enter either y or n:  ")
+                if result not in ('y', 'n'):
+                    raise ValueError("Expected y or n")
+                if result == 'y':
+                    return cls.read_initial_position()
+                return cls.random_initial_position()
+            except (KeyboardInterrupt, EOFError):
+                raise
+            except Exception:
+                print("\nInvalid input.\n")
 
     @classmethod
     def read_game_mode(cls):
         """Reads the game mode name and checks its validity"""
-        try:
-            print("The Game has the following modes:\n\t- smart (if possible, the program uses a winning strategy against user)")
-            print("\t- random (program makes random moves)\n\t- advisor (if possible, the program advises a winning strategy for the user).\n")
-            result = input(f"Choose the game mode (smart/random/advisor): ").strip()
-            assert result in ['smart', 'random', 'advisor']
-            return result
-        except KeyboardInterrupt:
-            raise
-        except:
-            print("\nInvalid game mode name.\n")
-            return cls.read_game_mode()
+        while True:
+            try:
+                print("The Game has the following modes:\n\t- smart (if possible, the program uses a winning strategy against user)")
+                print("\t- random (program makes random moves)\n\t- advisor (if possible, the program advises a winning strategy for the user).\n")
+                result = input(f"Choose the game mode (smart/random/advisor): ").strip()
+                if result not in ('smart', 'random', 'advisor'):
+                    raise ValueError("Unknown game mode")
+                return result
+            except (KeyboardInterrupt, EOFError):
+                raise
+            except Exception:
+                print("\nInvalid game mode name.\n")
 
     @classmethod
     def read_play_again(cls):
         """Reads the input for playing another game"""
-        try:
-            result = input("Do you want to play another game? (y/n): ")
-            assert result in ['y', 'n']
-            return result == 'y'
-        except KeyboardInterrupt:
-            raise
-        except:
-            print("\nInvalid input.\n")
-            return cls.read_play_again()
+        while True:
+            try:
+                result = input("Do you want to play another game? (y/n): ")
+                if result not in ('y', 'n'):
+                    raise ValueError("Expected y or n")
+                return result == 'y'
+            except (KeyboardInterrupt, EOFError):
+                raise
+            except Exception:
+                print("\nInvalid input.\n")
 
 class Game:
     """
@@ -124,11 +147,13 @@ class Game:
     DUPLICATOR_ID = 0
     SPOILER_ID = 1
 
-    PLAYER_NAMES = {
-        0: 'Duplicator', 1: 'Spoiler'
-    }
+    # Indexed by player ID
+    PLAYER_NAMES = ('Duplicator', 'Spoiler')
+
+    # When set, log messages are not echoed to stdout
+    quiet = False
 
-    def __init__(self, day, month, year, initial_position) -> None:
+    def __init__(self, day, month, year, initial_position, log_to_file=True) -> None:
         # Initialize game
         self.next_player = self.__class__.DUPLICATOR_ID
         self.winner = None
@@ -136,43 +161,61 @@ class Game:
         self.initial_position  = initial_position
         self.final_position = day + month + year 
         self.max_move = day + month
-        assert initial_position >= 1
-
-        # Create and open the log file for writing
-        self.log_file_name =  datetime.now().strftime("%d_%H_%M_%S.txt")
-        self.log_file = open(self.log_file_name, 'a')
-        print(f"-> Opened log for the current game at {self.log_file.name}")
-        self.log_operation(f"Started Game at initial position {self.current_position}, with final position {self.final_position}")
-        self.log_operation(f"Allowed moves are in [(+1) .. (+{self.max_move})], legal positions are [{self.current_position} .. {self.final_position}].")
-
-
-    def __del__(self):
-        # We need to make sure that the log file buffer is flushed and closed when the object is deleted
-        self.log_file.flush()
-        self.log_file.close()
-
-    def log_operation(self, message):
-        """Helper function to log output to both stdout and the log file"""
-        print(message)
-        self.log_file.write(message+'\n')
+        self._update_move_cap()
+        if initial_position < 1:
+            raise ValueError("Initial position should be at least 1")
+
+        # Use the session log file for writing
+        self.log_fd = None
+        if log_to_file:
+            self.log_fd = session_log_fd()
+            self.log_file_name = _LOG_FILE_NAME
+            print(f"-> Logging the current game at {self.log_file_name}")
+        self.log_operation("Started Game at initial position %d, with final position %d", self.current_position, self.final_position)
+        self.log_operation("Allowed moves are in [(+1) .. (+%d)], legal positions are [%d .. %d].", self.max_move, self.current_position, self.final_position)
+
+    def log_operation(self, fmt, *args):
+        """
+        Helper function to log output to both stdout and the log file.
+        The message is only formatted (as fmt % args) if it is printed or logged
+        """
+        if self.quiet and self.log_fd is None:
+            return
+        message = fmt % args if args else fmt
+        if not self.quiet:
+            print(message)
+        if self.log_fd is not None:
+            # O_APPEND makes every write land at the end of the file, so no buffering or flushing is needed
+            os.write(self.log_fd, (message+'\n').encode('utf-8'))
+
+    def _update_move_cap(self):
+        """Updates the distance to the final position and the biggest legal move from the current position"""
+        self.remaining = self.final_position - self.current_position
+        self.move_cap = min(self.max_move, self.remaining)
 
     def perform_move(self, move):
         """Performs a move and checks if a player wins after the move"""
-        assert self.winner is None 
-        assert move >= 1 and move <= self.max_move and self.current_position + move <= self.final_position, "Illegal move"
+        if self.winner is not None:
+            raise ValueError("The game is already over")
+        if not 1 <= move <= self.move_cap:
+            raise ValueError("Illegal move")
         self.current_position += move 
-        self.log_operation(f"{self.__class__.PLAYER_NAMES[self.next_player]} moved by (+{move}) to {self.current_position}")
+        self._update_move_cap()
+        self.log_operation("%s moved by (+%d) to %d", self.__class__.PLAYER_NAMES[self.next_player], move, self.current_position)
         # Check for winning
         if self.current_position == self.final_position:
             self.winner = self.next_player
-            self.log_operation(f"{self.__class__.PLAYER_NAMES[self.winner]} WON!")
-        self.next_player = (self.next_player+1)%2
+            self.log_operation("%s WON!", self.__class__.PLAYER_NAMES[self.winner])
+        self.next_player ^= 1
 
 
 class SpoilerBot:
     """
     Implements the playing bot that plays as the Spoiler
     """
+    # Bound randrange of a dedicated generator, used to pick random moves
+    _randrange = random.Random().randrange
+
     def __init__(self, day, month, year, initial_position, game_mode) -> None:
         # Initialize the game
         self.game = Game(day, month, year, initial_position)
@@ -183,48 +226,7 @@ class SpoilerBot:
             'advisor': self.advisor_mode
         }
         self.play_mode = self.mode_implementations[game_mode]
-        self.game.log_operation(f"Game started in {game_mode} mode.")
-
-
-        self.winning_strategy = set()
-        self.winning_strategy.update(range(max(self.game.final_position - self.game.max_move, initial_position), self.game.final_position))
-        # Holds the winning moves from every winning positions
-        self.winning_moves = {x: [self.game.final_position] for x in self.winning_strategy}
-        
-        self.find_winning_strategy()
-        
-
-    def find_winning_strategy(self):
-        """
-        Calculates the winning positions, as well as the winning moves, using Backwards-Induction
-        """
-        previous_positions = self.winning_strategy
-        while True:
-            new_positions = set()
-            updated_strategy = False
-            for i in previous_positions:
-                for opponent_position in range(max(self.game.initial_position, i-self.game.max_move), i):
-                    if opponent_position < self.game.initial_position or opponent_position in self.winning_strategy:
-                        continue
-                    all_winning = True
-                    # Check that all opponent moves from this position lead to a winning position for the player
-                    for potential_opponent_next_position in range(opponent_position+1, opponent_position+self.game.max_move+1):
-                        if potential_opponent_next_position not in self.winning_strategy:
-                            all_winning = False
-                            break
-                    if all_winning:
-                        # Add all positions that lead the opponent to this position
-                        new_positions.update(range(max(self.game.initial_position, opponent_position - self.game.max_move), opponent_position))
-                        # Add all the moves
-                        for x in range(opponent_position - self.game.max_move, opponent_position):
-                            self.winning_moves[x] = (self.winning_moves.get(x) or [])  + [opponent_position]
-                        updated_strategy = True
-            self.winning_strategy.update(new_positions)
-            previous_positions = new_positions
-
-            # If we didn't find any new winning positions to explore, stop the backwards induction algorithm
-            if not updated_strategy:
-                break
+        self.game.log_operation("Game started in %s mode.", game_mode)
 
     def play(self):
         """Plays the game"""
@@ -238,28 +240,28 @@ class SpoilerBot:
 
     def read_next_move(self):
         """Takes the next player move"""
-        try:
-            result = int(input(f"You're at position {self.game.current_position}. Enter your next move (should be in range [1 .. {min(self.game.max_move, self.game.final_position - self.game.current_position)}]): "))
-            assert result in range(1, min(self.game.max_move, self.game.final_position - self.game.current_position)+1)
-            return result
-        except KeyboardInterrupt:
-            raise
-        except:
-            print("Invalid move.")
-            return self.read_next_move()
+        while True:
+            try:
+                result = int(input(f"You're at position {self.game.current_position}. Enter your next move (should be in range [1 .. {self.game.move_cap}]): "))
+                if not 1 <= result <= self.game.move_cap:
+                    raise ValueError("Illegal move")
+                return result
+            except (KeyboardInterrupt, EOFError):
+                raise
+            except Exception:
+                print("Invalid move.")
 
     def pick_smart_move(self):
         """
-        Picks the biggest position from the winning strategy that is accessible from the current position (to make the game end as fast as possible).
+        Picks the winning move from the current position, i.e. the move that leaves the opponent at a distance from the final position that is a multiple of (max_move + 1).
         Returns None in case the current position doesn't belong to the winning strategy
         """
-        if self.game.current_position in self.winning_strategy:
-            return max(self.winning_moves.get(self.game.current_position)) - self.game.current_position or None
-        return None
+        r = self.game.remaining % (self.game.max_move + 1)
+        return r if r > 0 else None
 
     def pick_random_move(self):
         """Returns a random legal move from the current position"""
-        return random.randint(1, min(self.game.max_move, self.game.final_position - self.game.current_position))
+        return self.__class__._randrange(1, self.game.move_cap+1)
 
     def random_mode(self):
         """Plays in random mode"""
@@ -285,9 +287,9 @@ class SpoilerBot:
         # Give advice
         advised_move = self.pick_smart_move()
         if advised_move is None:
-            self.game.log_operation(f"[ADVISOR] No winning strategy at the current position. Pick any moves. Fingers-crossed!")
+            self.game.log_operation("[ADVISOR] No winning strategy at the current position. Pick any moves. Fingers-crossed!")
         else:
-            self.game.log_operation(f"[ADVISOR] We advise you to move by +{advised_move}")
+            self.game.log_operation("[ADVISOR] We advise you to move by +%d", advised_move)
         self.game.perform_move(self.read_next_move())
         if self.game.winner is not None:
             return